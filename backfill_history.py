@@ -6,25 +6,48 @@ Backfill historical FinFam + FRED + Yahoo data into data/mortgage_daily.csv.
 from __future__ import annotations
 
 import argparse
-import csv
+import asyncio
 import datetime as dt
+import re
 import sys
-from bisect import bisect_right
+import time
+from email.utils import parsedate_to_datetime
 from pathlib import Path
 from typing import Any, Optional
 
+import aiohttp
+import numpy as np
+import orjson
 import requests
 
 from finfam import (
+    CACHE_DIR,
+    DEFAULT_HEADERS,
     FINFAM_BASE,
+    FRED_CSV,
     OUTCSV,
-    fetch_fred_latest,
-    http_get,
+    RETRY_BACKOFF_FACTOR,
+    RETRY_MAX_WAIT,
+    RETRY_STATUSES,
+    RETRY_TOTAL,
+    http_get_cached,
     parse_finfam_30y,
-    write_row_csv,
+    parse_fred_csv,
+    read_csv_index,
+    write_rows_csv,
 )
 
 
+# Cap on in-flight FinFam requests, and on open connections to the FinFam host.
+FINFAM_CONCURRENCY = 32
+FINFAM_LIMIT_PER_HOST = 16
+# Sustained FinFam request rate (requests/second); bursts up to FINFAM_CONCURRENCY.
+FINFAM_REQUESTS_PER_SECOND = 20.0
+
+# Series are kept as sorted int64 arrays of proleptic ordinals (date.toordinal()).
+EPOCH_ORDINAL = dt.date(1970, 1, 1).toordinal()
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Backfill historical rate data.")
     parser.add_argument("--days", type=int, default=30, help="Number of days to backfill")
@@ -33,12 +56,21 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
-def load_existing_dates(path: Path) -> set[str]:
+def load_existing_dates(path: Path) -> frozenset[int]:
+    """
+    Return the run dates already in the CSV, as date ordinals for cheap membership tests.
+    """
     if not path.exists():
-        return set()
-    with path.open("r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        return {row.get("run_date_utc", "") for row in reader if row.get("run_date_utc")}
+        return frozenset()
+    # Only the run_date_utc column is needed, so skip building a dict per row.
+    _, dates = read_csv_index(path)
+    ordinals: set[int] = set()
+    for value in dates:
+        try:
+            ordinals.add(dt.date.fromisoformat(value).toordinal())
+        except ValueError:
+            continue
+    return frozenset(ordinals)
 
 
 def parse_date(value: str) -> dt.date:
@@ -50,67 +82,146 @@ def date_range(start: dt.date, end: dt.date) -> list[dt.date]:
     return [start + dt.timedelta(days=i) for i in range(days + 1)]
 
 
-def fetch_finfam_for_date(date: dt.date) -> tuple[str, dict[str, Any]]:
+class TokenBucket:
+    """
+    Client-side rate limiter: `rate` tokens per second, holding at most `capacity`.
+    Each request awaits acquire() first, so parallel fetches stay under the server's limit.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def parse_retry_after(value: str) -> Optional[float]:
+    """
+    Seconds requested by a Retry-After header (delta-seconds or HTTP date), or None if unparseable.
+    """
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+        return max(0.0, (when - dt.datetime.now(dt.timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt: int, retry_after: Optional[str] = None) -> Optional[float]:
+    """
+    Seconds to wait before retry number `attempt` (0-based): the server's Retry-After when given,
+    else exponential backoff like urllib3's Retry, capped at RETRY_MAX_WAIT.
+    Returns None when the server asks for longer than RETRY_MAX_WAIT, meaning give up.
+    """
+    if retry_after:
+        requested = parse_retry_after(retry_after)
+        if requested is not None:
+            return requested if requested <= RETRY_MAX_WAIT else None
+    return min(RETRY_BACKOFF_FACTOR * (2**attempt), RETRY_MAX_WAIT)
+
+
+async def fetch_finfam_async(
+    session: aiohttp.ClientSession, date: dt.date, limiter: TokenBucket
+) -> tuple[str, dict[str, Any]]:
     url = f"{FINFAM_BASE}/rates_{date.isoformat()}.json"
-    data = http_get(url).json()
-    return url, data
-
-
-def fetch_fred_series(series_id: str) -> tuple[list[dt.date], list[float], str]:
-    result = fetch_fred_latest(series_id)
-    source = result.get(f"fred_{series_id}_source")
-    if not source:
-        source = f"https://fred.stlouisfed.org/graph/fredgraph.csv?id={series_id}"
-    text = http_get(source).text.strip().splitlines()
-    dates: list[dt.date] = []
-    values: list[float] = []
-    for line in text[1:]:
-        parts = line.split(",")
-        if len(parts) < 2:
-            continue
-        d, v = parts[0].strip(), parts[1].strip()
-        if v == "." or v == "":
-            continue
+    attempt = 0
+    while True:
+        await limiter.acquire()
         try:
-            dates.append(parse_date(d))
-            values.append(float(v))
-        except ValueError:
-            continue
-    return dates, values, source
+            async with session.get(url) as resp:
+                delay = None
+                if resp.status in RETRY_STATUSES and attempt < RETRY_TOTAL:
+                    delay = retry_delay(attempt, resp.headers.get("Retry-After"))
+                if delay is None:
+                    resp.raise_for_status()
+                    # The CDN doesn't always label these files as application/json.
+                    return url, orjson.loads(await resp.read())
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+            if attempt >= RETRY_TOTAL:
+                raise
+            delay = retry_delay(attempt)
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def fetch_finfam_many(
+    dates: list[dt.date],
+) -> list[tuple[dt.date, Optional[tuple[str, dict[str, Any]]]]]:
+    """
+    Fetch FinFam files for all dates concurrently.
+    Failed dates are reported and returned with None so the caller can skip them.
+    """
+    sem = asyncio.Semaphore(FINFAM_CONCURRENCY)
+    limiter = TokenBucket(rate=FINFAM_REQUESTS_PER_SECOND, capacity=FINFAM_CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit_per_host=FINFAM_LIMIT_PER_HOST)
+    timeout = aiohttp.ClientTimeout(total=30)
+
+    async with aiohttp.ClientSession(headers=DEFAULT_HEADERS, connector=connector, timeout=timeout) as session:
+
+        async def sem_fetch(date: dt.date) -> tuple[dt.date, Optional[tuple[str, dict[str, Any]]]]:
+            async with sem:
+                try:
+                    return date, await fetch_finfam_async(session, date, limiter)
+                except Exception as exc:
+                    print(f"Skipping {date.isoformat()}: FinFam fetch failed ({exc})", file=sys.stderr)
+                    return date, None
 
+        return await asyncio.gather(*[sem_fetch(d) for d in dates])
 
-def fetch_yahoo_series(symbol: str, range_str: str = "2y") -> tuple[list[dt.date], list[float]]:
+
+def fetch_fred_series(series_id: str) -> tuple[np.ndarray, np.ndarray, str]:
+    source = FRED_CSV.format(series_id=series_id)
+    text = http_get_cached(source, CACHE_DIR / f"fred_{series_id}.csv")
+    df = parse_fred_csv(text)
+    ords = df["date"].to_numpy().astype("datetime64[D]").astype(np.int64) + EPOCH_ORDINAL
+    values = df["value"].to_numpy(dtype=np.float64)
+    return ords, values, source
+
+
+def fetch_yahoo_series(symbol: str, range_str: str = "2y") -> tuple[np.ndarray, np.ndarray]:
     url = (
         "https://query1.finance.yahoo.com/v8/finance/chart/"
         f"{requests.utils.quote(symbol, safe='')}?range={range_str}&interval=1d"
     )
-    data = http_get(url).json()
+    safe_symbol = re.sub(r"[^A-Za-z0-9_.-]", "_", symbol)
+    data = orjson.loads(http_get_cached(url, CACHE_DIR / f"yahoo_{safe_symbol}_{range_str}.json"))
     result = (data.get("chart", {}) or {}).get("result")
     if not result:
-        return [], []
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
     r0 = result[0]
     timestamps = r0.get("timestamp") or []
     closes = (((r0.get("indicators") or {}).get("quote") or [{}])[0]).get("close") or []
-    dates: list[dt.date] = []
-    values: list[float] = []
-    for t, c in zip(timestamps, closes):
-        if c is None:
-            continue
-        d = dt.datetime.fromtimestamp(int(t), tz=dt.timezone.utc).date()
-        dates.append(d)
-        values.append(float(c))
-    return dates, values
+    n = min(len(timestamps), len(closes))  # zip() semantics: align from the start
+    ts_arr = np.array(timestamps[:n], dtype=np.int64)
+    closes_arr = np.array([np.nan if c is None else c for c in closes[:n]], dtype=np.float64)
+    mask = ~np.isnan(closes_arr)
+    # Epoch seconds -> UTC calendar day -> ordinal, all in one vector pass.
+    days = ts_arr[mask].astype("datetime64[s]").astype("datetime64[D]").astype(np.int64)
+    return days + EPOCH_ORDINAL, closes_arr[mask]
 
 
 def value_on_or_before(
-    dates: list[dt.date], values: list[float], target: dt.date
+    ords: np.ndarray, values: np.ndarray, target: dt.date
 ) -> tuple[Optional[dt.date], Optional[float]]:
-    if not dates:
-        return None, None
-    idx = bisect_right(dates, target) - 1
+    idx = int(np.searchsorted(ords, target.toordinal(), side="right")) - 1
     if idx < 0:
         return None, None
-    return dates[idx], values[idx]
+    return dt.date.fromordinal(int(ords[idx])), float(values[idx])
 
 
 def main() -> int:
@@ -125,24 +236,24 @@ def main() -> int:
         end_date = today
         start_date = today - dt.timedelta(days=days - 1)
 
-    existing_dates = load_existing_dates(OUTCSV)
-    fred_dgs10_dates, fred_dgs10_values, fred_dgs10_source = fetch_fred_series("DGS10")
-    fred_mort30_dates, fred_mort30_values, fred_mort30_source = fetch_fred_series("MORTGAGE30US")
-    yahoo_dates, yahoo_values = fetch_yahoo_series("^TNX", range_str="2y")
+    existing_ordinals = load_existing_dates(OUTCSV)
+    fred_dgs10_ords, fred_dgs10_values, fred_dgs10_source = fetch_fred_series("DGS10")
+    fred_mort30_ords, fred_mort30_values, fred_mort30_source = fetch_fred_series("MORTGAGE30US")
+    yahoo_ords, yahoo_values = fetch_yahoo_series("^TNX", range_str="2y")
 
-    for date in date_range(start_date, end_date):
-        if date.isoformat() in existing_dates:
-            continue
-        try:
-            finfam_url, finfam_data = fetch_finfam_for_date(date)
-        except Exception as exc:
-            print(f"Skipping {date.isoformat()}: FinFam fetch failed ({exc})", file=sys.stderr)
+    dates = [d for d in date_range(start_date, end_date) if d.toordinal() not in existing_ordinals]
+    results = asyncio.run(fetch_finfam_many(dates)) if dates else []
+
+    rows: list[dict[str, Any]] = []
+    for date, fetched in results:
+        if fetched is None:
             continue
+        finfam_url, finfam_data = fetched
 
         finfam_30y = parse_finfam_30y(finfam_data)
-        dgs10_date, dgs10_value = value_on_or_before(fred_dgs10_dates, fred_dgs10_values, date)
-        mort30_date, mort30_value = value_on_or_before(fred_mort30_dates, fred_mort30_values, date)
-        tnx_date, tnx_value = value_on_or_before(yahoo_dates, yahoo_values, date)
+        dgs10_date, dgs10_value = value_on_or_before(fred_dgs10_ords, fred_dgs10_values, date)
+        mort30_date, mort30_value = value_on_or_before(fred_mort30_ords, fred_mort30_values, date)
+        tnx_date, tnx_value = value_on_or_before(yahoo_ords, yahoo_values, date)
 
         row: dict[str, Any] = {
             "run_date_utc": date.isoformat(),
@@ -160,9 +271,11 @@ def main() -> int:
             "yahoo_^TNX_date": tnx_date.isoformat() if tnx_date else None,
             "yahoo_^TNX_close": tnx_value,
         }
+        rows.append(row)
 
-        write_row_csv(OUTCSV, row)
-        print(f"Backfilled {date.isoformat()}")
+    write_rows_csv(OUTCSV, rows)
+    for row in rows:
+        print(f"Backfilled {row['run_date_utc']}")
 
     return 0
 
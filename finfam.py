@@ -15,14 +15,26 @@ from __future__ import annotations
 
 import csv
 import datetime as dt
+import io
 import json
+import os
 import re
+import shutil
 import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, Iterator, Optional
 
+import numpy as np
+import orjson
+import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
 
 
 # -----------------------------
@@ -41,6 +53,8 @@ YAHOO_CHART = "https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?range=
 
 OUTDIR = Path("data")
 OUTCSV = OUTDIR / "mortgage_daily.csv"
+# Raw FRED/Yahoo responses, revalidated with conditional requests (see http_get_cached)
+CACHE_DIR = OUTDIR / ".cache"
 
 
 DEFAULT_HEADERS = {
@@ -50,30 +64,171 @@ DEFAULT_HEADERS = {
 }
 
 
+# Retry policy for transient upstream failures (shared with the async backfill fetches).
+RETRY_TOTAL = 5
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# Longest we'll wait between attempts; a longer Retry-After means give up instead of sleeping.
+RETRY_MAX_WAIT = 60.0
+
+
+# Scrape patterns, compiled once. Each list is tried in order; first match wins.
+_SCRAPE_FLAGS = re.IGNORECASE | re.MULTILINE
+ZILLOW_RATE_PATTERNS = [
+    # Example (currently): "current 30-year fixed mortgage rates in Oregon are 5.99%"
+    re.compile(r"30-year fixed mortgage rates in oregon are\s*([0-9.]+)\s*%", _SCRAPE_FLAGS),
+    re.compile(r"30-Year Fixed.*?\bRate\s*([0-9.]+)\s*%", _SCRAPE_FLAGS),  # fallback
+]
+ZILLOW_APR_PATTERNS = [
+    re.compile(r"30-Year Fixed.*?\bAPR\s*([0-9.]+)\s*%", _SCRAPE_FLAGS),
+]
+BANKRATE_RATE_PATTERNS = [
+    # Example (currently): "current interest rates in Oregon are 6.17 percent for a 30-year fixed mortgage"
+    re.compile(r"current interest rates in oregon are\s*([0-9.]+)\s*percent\s*for a\s*30-year fixed", _SCRAPE_FLAGS),
+    re.compile(r"\b30-Year Fixed Rate\b.*?\b([0-9.]+)\s*%", _SCRAPE_FLAGS),  # fallback
+]
+
+
 # -----------------------------
 # Helpers
 # -----------------------------
+class _CappedRetry(Retry):
+    """
+    urllib3 Retry that gives up, rather than sleeping, when Retry-After exceeds RETRY_MAX_WAIT.
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):  # type: ignore[override]
+        if response is not None and self.respect_retry_after_header:
+            retry_after = self.get_retry_after(response)
+            if retry_after is not None and retry_after > RETRY_MAX_WAIT:
+                reason = ResponseError(f"Retry-After of {retry_after:.0f}s exceeds {RETRY_MAX_WAIT:.0f}s")
+                raise MaxRetryError(_pool, url, reason)
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+def _make_session() -> requests.Session:
+    """
+    One pooled session for all sync fetches, so repeat requests to a host reuse the TLS connection.
+    Transient 429/5xx responses are retried with exponential backoff (honoring Retry-After)
+    before raise_for_status sees them.
+    """
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    retry = _CappedRetry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF_FACTOR,
+        backoff_max=RETRY_MAX_WAIT,
+        status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=32, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_SESSION = _make_session()
+
+
 def http_get(url: str, timeout: int = 30) -> requests.Response:
-    r = requests.get(url, headers=DEFAULT_HEADERS, timeout=timeout)
+    r = _SESSION.get(url, timeout=timeout)
     r.raise_for_status()
     return r
 
 
+@contextmanager
+def _atomic_target(path: Path, mode_from: Optional[Path] = None) -> Iterator[Path]:
+    """
+    Yield a temp path in path's directory. If the block succeeds the temp file replaces path
+    atomically (taking the permissions of mode_from, else of the existing path); otherwise it is removed.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    os.close(fd)
+    tmp = Path(tmp_name)
+    try:
+        yield tmp
+        mode_source = mode_from or path
+        if mode_source.exists():
+            shutil.copymode(mode_source, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def http_get_cached(url: str, cache_path: Path, timeout: int = 30) -> str:
+    """
+    GET url and return the body text, keeping a copy at cache_path.
+    The ETag/Last-Modified validators live in a sidecar <cache_path>.meta.json; when the
+    cached copy is still current the server answers 304 and the body comes from disk.
+    """
+    meta_path = cache_path.with_name(cache_path.name + ".meta.json")
+    cond_headers: dict[str, str] = {}
+    if cache_path.exists() and meta_path.exists():
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except ValueError:
+            meta = {}
+        if meta.get("url") == url:
+            # Only the server's own validators are sent; without them every request is a full GET.
+            if meta.get("etag"):
+                cond_headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                cond_headers["If-Modified-Since"] = meta["last_modified"]
+
+    r = _SESSION.get(url, headers=cond_headers, timeout=timeout)
+    if r.status_code == 304 and cond_headers:
+        return cache_path.read_text(encoding="utf-8")
+    r.raise_for_status()
+
+    # Body first, sidecar last: an interrupted run never leaves validators beside a partial body.
+    with _atomic_target(cache_path) as tmp:
+        tmp.write_text(r.text, encoding="utf-8")
+    meta = {"url": url, "etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}
+    with _atomic_target(meta_path) as tmp:
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+    return r.text
+
+
+def _probe_status(url: str) -> Optional[int]:
+    try:
+        return _SESSION.head(url, timeout=10, allow_redirects=True).status_code
+    except Exception:
+        return None
+
+
 def try_finfam_latest(max_lookback_days: int = 10) -> tuple[str, dict[str, Any]]:
     """
     FinFam publishes daily files like:
       rates_2025-12-30.json
     We'll try today in UTC and back off N days until we find one.
+
+    All candidate files are probed with parallel HEAD requests first, so only the
+    file we actually use is downloaded.
     """
     # Use UTC date because FinFam metadata timestamps are UTC.
     today = dt.datetime.now(dt.timezone.utc).date()
+    urls = [
+        f"{FINFAM_BASE}/rates_{(today - dt.timedelta(days=i)).isoformat()}.json"
+        for i in range(max_lookback_days + 1)
+    ]
 
+    try:
+        with ThreadPoolExecutor(max_workers=len(urls)) as ex:
+            statuses = list(ex.map(_probe_status, urls))
+    except Exception:
+        statuses = [None] * len(urls)
+
+    # Newest first, skipping files the probe showed are missing. If HEAD isn't
+    # supported (or the probe failed) this is the plain day-by-day walk.
     last_err: Optional[Exception] = None
-    for i in range(max_lookback_days + 1):
-        d = today - dt.timedelta(days=i)
-        url = f"{FINFAM_BASE}/rates_{d.isoformat()}.json"
+    for url, status in zip(urls, statuses):
+        if status in (403, 404):
+            continue
         try:
-            data = http_get(url).json()
+            data = orjson.loads(http_get(url).content)
             return url, data
         except Exception as e:
             last_err = e
@@ -98,24 +253,27 @@ def parse_finfam_30y(data: dict[str, Any]) -> dict[str, Any]:
     best_apr = None
     best_inst = None
     min_apr_inst = None
-    min_apr_value = None
-
-    for inst in data.get("institutions", []) or []:
-        name = inst.get("name")
-        for rate in inst.get("rates", []) or []:
-            if rate.get("normalized_product_type") != "30-year-fixed":
-                continue
-            apr = rate.get("apr")
-            if apr is None:
-                continue
-            if min_apr_value is None or apr < min_apr_value:
-                min_apr_value = apr
-                min_apr_inst = name
-            if (rate.get("outlier_reason") or "").strip():
-                continue
-            if best_apr is None or apr < best_apr:
-                best_apr = apr
-                best_inst = name
+
+    # Flatten institutions[].rates[] into (apr, is_outlier, institution) tuples; the NumPy arrays are built from these.
+    flat = [
+        (rate.get("apr"), bool((rate.get("outlier_reason") or "").strip()), inst.get("name"))
+        for inst in data.get("institutions", []) or []
+        for rate in inst.get("rates", []) or []
+        if rate.get("normalized_product_type") == "30-year-fixed" and rate.get("apr") is not None
+    ]
+    if flat:
+        aprs = np.asarray([f[0] for f in flat], dtype=np.float64)
+        outlier = np.asarray([f[1] for f in flat], dtype=bool)
+        finite = np.isfinite(aprs)
+        valid = finite & ~outlier
+
+        # argmin picks the first minimum, so ties go to the earliest institution.
+        if finite.any():
+            i = int(np.argmin(np.where(finite, aprs, np.inf)))
+            min_apr_inst = flat[i][2]
+        if valid.any():
+            i = int(np.argmin(np.where(valid, aprs, np.inf)))
+            best_apr, best_inst = flat[i][0], flat[i][2]
 
     return {
         "finfam_observation_date": obs_date,
@@ -130,9 +288,9 @@ def parse_finfam_30y(data: dict[str, Any]) -> dict[str, Any]:
     }
 
 
-def extract_first_float(patterns: list[str], text: str) -> Optional[float]:
+def extract_first_float(patterns: list[re.Pattern[str]], text: str) -> Optional[float]:
     for pat in patterns:
-        m = re.search(pat, text, flags=re.IGNORECASE | re.MULTILINE)
+        m = pat.search(text)
         if m:
             try:
                 return float(m.group(1))
@@ -143,49 +301,40 @@ def extract_first_float(patterns: list[str], text: str) -> Optional[float]:
 
 def fetch_zillow_or_30y() -> dict[str, Any]:
     html = http_get(ZILLOW_OR_URL).text
-    # Example (currently): "current 30-year fixed mortgage rates in Oregon are 5.99%"
-    rate = extract_first_float(
-        [
-            r"30-year fixed mortgage rates in oregon are\s*([0-9.]+)\s*%",
-            r"30-Year Fixed.*?\bRate\s*([0-9.]+)\s*%",  # fallback
-        ],
-        html,
-    )
-    apr = extract_first_float([r"30-Year Fixed.*?\bAPR\s*([0-9.]+)\s*%"], html)
+    rate = extract_first_float(ZILLOW_RATE_PATTERNS, html)
+    apr = extract_first_float(ZILLOW_APR_PATTERNS, html)
     return {"zillow_or_30y_rate": rate, "zillow_or_30y_apr": apr}
 
 
 def fetch_bankrate_or_30y() -> dict[str, Any]:
     html = http_get(BANKRATE_OR_URL).text
-    # Example (currently): "current interest rates in Oregon are 6.17 percent for a 30-year fixed mortgage"
-    rate = extract_first_float(
-        [
-            r"current interest rates in oregon are\s*([0-9.]+)\s*percent\s*for a\s*30-year fixed",
-            r"\b30-Year Fixed Rate\b.*?\b([0-9.]+)\s*%",  # fallback
-        ],
-        html,
-    )
+    rate = extract_first_float(BANKRATE_RATE_PATTERNS, html)
     return {"bankrate_or_30y_rate": rate}
 
 
+def parse_fred_csv(text: str) -> pd.DataFrame:
+    """
+    Parse a fredgraph.csv body into (date, value) columns, dropping missing or malformed rows.
+    """
+    # header: DATE,<SERIES> (FRED has also used observation_date); position is what's stable.
+    df = pd.read_csv(io.StringIO(text), header=0, names=["date", "value"], usecols=[0, 1], na_values=["."])
+    df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d", errors="coerce")
+    df["value"] = pd.to_numeric(df["value"], errors="coerce")
+    return df.dropna()
+
+
 def fetch_fred_latest(series_id: str) -> dict[str, Any]:
     """
     Pull the last non-missing value from fredgraph.csv.
     """
     url = FRED_CSV.format(series_id=series_id)
-    text = http_get(url).text.strip().splitlines()
-    # header: DATE,<SERIES>
+    df = parse_fred_csv(http_get(url).text)
+
     last_date = None
     last_val = None
-
-    for line in text[1:]:
-        parts = line.split(",")
-        if len(parts) < 2:
-            continue
-        d, v = parts[0].strip(), parts[1].strip()
-        if v == "." or v == "":
-            continue
-        last_date, last_val = d, float(v)
+    if not df.empty:
+        last = df.iloc[-1]
+        last_date, last_val = last["date"].date().isoformat(), float(last["value"])
 
     return {
         f"fred_{series_id}_date": last_date,
@@ -201,7 +350,7 @@ def fetch_yahoo_latest(symbol: str) -> dict[str, Any]:
     """
     try:
         url = YAHOO_CHART.format(symbol=requests.utils.quote(symbol, safe=""))
-        j = http_get(url).json()
+        j = orjson.loads(http_get(url).content)
 
         result = (j.get("chart", {}) or {}).get("result")
         if not result:
@@ -211,15 +360,17 @@ def fetch_yahoo_latest(symbol: str) -> dict[str, Any]:
         ts = r0.get("timestamp") or []
         closes = (((r0.get("indicators") or {}).get("quote") or [{}])[0]).get("close") or []
 
-        # Walk from the end to find last non-null close
+        # Last non-null close; series are aligned from the end if lengths differ.
+        n = min(len(ts), len(closes))
+        ts, closes = ts[len(ts) - n :], closes[len(closes) - n :]
+        arr = np.array([np.nan if c is None else c for c in closes], dtype=np.float64)
+        nz = np.flatnonzero(~np.isnan(arr))
         last_close = None
         last_ts = None
-        for t, c in zip(reversed(ts), reversed(closes)):
-            if c is None:
-                continue
-            last_close = float(c)
-            last_ts = int(t)
-            break
+        if nz.size:
+            i = int(nz[-1])
+            last_close = float(arr[i])
+            last_ts = int(ts[i])
 
         last_date = dt.datetime.fromtimestamp(last_ts, tz=dt.timezone.utc).date().isoformat() if last_ts else None
         return {f"yahoo_{symbol}_date": last_date, f"yahoo_{symbol}_close": last_close}
@@ -235,48 +386,153 @@ class DailyRow:
     payload: dict[str, Any]
 
 
-def write_row_csv(path: Path, row: dict[str, Any]) -> None:
+def read_csv_index(path: Path) -> tuple[list[str], set[str]]:
+    """
+    Return the header and the run_date_utc values of an existing CSV, without keeping rows around.
+    """
+    with path.open("r", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        headers = next(reader, [])
+        if "run_date_utc" not in headers:
+            return headers, set()
+        idx = headers.index("run_date_utc")
+        return headers, {r[idx] for r in reader if len(r) > idx and r[idx]}
+
+
+def _ends_with_newline(path: Path) -> bool:
+    with path.open("rb") as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            return True
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def _append_rows(f: Any, headers: list[str], rows: list[dict[str, Any]]) -> None:
+    """
+    Write rows in header order. A single row (the daily run) goes through csv.DictWriter; a
+    multi-row backfill batch is written with one DataFrame.to_csv call. Both give the same
+    bytes: missing keys and None -> "", NaN -> "nan", CRLF line endings.
+    """
+    if len(rows) == 1:
+        csv.DictWriter(f, fieldnames=headers).writerows(rows)
+        return
+    # Fill missing/None cells with "" up front so na_rep only ever sees real NaN values.
+    blank = dict.fromkeys(headers, "")
+    frame = pd.DataFrame(
+        [{**blank, **{k: v for k, v in r.items() if v is not None}} for r in rows],
+        columns=headers,
+        dtype=object,  # keep values as-is (no int -> float upcasts)
+    )
+    frame.to_csv(f, header=False, index=False, na_rep="nan", lineterminator="\r\n")
+
+
+def _merge_rows_into_csv(path: Path, rows: list[dict[str, Any]]) -> None:
+    """
+    Write rows to the CSV in a single pass, de-duplicating by run_date_utc.
+
+    The common case (no new columns, no dates already present) is a plain append.
+    Otherwise the file is rewritten with the expanded header and same-day rows replaced.
+    """
     path.parent.mkdir(parents=True, exist_ok=True)
-    file_exists = path.exists()
 
-    if not file_exists:
-        headers = list(row.keys())
+    # Collapse rows sharing a run date so each date is written once.
+    pending: dict[str, dict[str, Any]] = {}
+    unkeyed: list[dict[str, Any]] = []
+    for row in rows:
+        run_date = row.get("run_date_utc")
+        if run_date:
+            pending.setdefault(run_date, {}).update(row)
+        else:
+            unkeyed.append(row)
+    incoming = [*pending.values(), *unkeyed]
+
+    if not path.exists():
+        headers = list(dict.fromkeys(k for r in incoming for k in r.keys()))
         with path.open("w", newline="", encoding="utf-8") as f:
-            w = csv.DictWriter(f, fieldnames=headers)
-            w.writeheader()
-            w.writerow(row)
+            csv.writer(f).writerow(headers)
+            _append_rows(f, headers, incoming)
         return
 
-    with path.open("r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        headers = reader.fieldnames or []
-        prior = list(reader)
+    headers, existing_dates = read_csv_index(path)
+    new_keys = [k for row in incoming for k in row.keys() if k not in headers]
 
+    if headers and not new_keys and existing_dates.isdisjoint(pending):
+        needs_newline = not _ends_with_newline(path)
+        with path.open("a", newline="", encoding="utf-8") as f:
+            if needs_newline:
+                # An edited file may lack its final newline; don't glue the new row onto the last one.
+                f.write("\r\n")
+            _append_rows(f, headers, incoming)
+        return
+
+    old_headers = list(headers)
     # Add any new keys to the end
-    for k in row.keys():
+    for k in new_keys:
         if k not in headers:
             headers.append(k)
+    date_idx = old_headers.index("run_date_utc") if "run_date_utc" in old_headers else None
+    pad = [""] * (len(headers) - len(old_headers))
 
-    run_date = row.get("run_date_utc")
-    replaced = False
-    updated: list[dict[str, Any]] = []
-    for r in prior:
-        if run_date and r.get("run_date_utc") == run_date:
-            merged = dict(r)
-            merged.update(row)
-            updated.append(merged)
-            replaced = True
-        else:
-            updated.append(r)
+    # Stream the old file into a temp file alongside it, then swap it in atomically.
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", newline="", encoding="utf-8") as out:
+            # Old rows are written back as raw field lists; dict rows (merged or new) go through DictWriter.
+            w = csv.writer(out)
+            dw = csv.DictWriter(out, fieldnames=headers, extrasaction="ignore")
+            dw.writeheader()
+            with path.open("r", newline="", encoding="utf-8") as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                for r in reader:
+                    if len(r) > len(old_headers):
+                        raise ValueError(
+                            f"{path}:{reader.line_num}: row has {len(r)} fields but the header has {len(old_headers)}"
+                        )
+                    run_date = r[date_idx] if date_idx is not None and len(r) > date_idx else None
+                    if run_date and run_date in pending:
+                        merged = dict(zip(old_headers, r))
+                        merged.update(pending[run_date])
+                        dw.writerow(merged)
+                    else:
+                        # Old rows already hold fields in header order; just pad the new columns.
+                        r = r + [""] * (len(old_headers) - len(r))
+                        w.writerow(r + pad)
+            dw.writerows(r for d, r in pending.items() if d not in existing_dates)
+            dw.writerows(unkeyed)
+        # mkstemp creates the file 0600; keep the original file's permissions.
+        shutil.copymode(path, tmp_name)
+        os.replace(tmp_name, path)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
 
-    if not replaced:
-        updated.append(row)
 
-    with path.open("w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=headers)
-        w.writeheader()
-        for r in updated:
-            w.writerow(r)
+def _write_feather(csv_path: Path) -> None:
+    """
+    Mirror the CSV as <name>.feather so plotting can skip CSV parsing.
+    The CSV stays the source of truth: if the mirror can't be written, any stale copy is removed.
+    """
+    feather_path = csv_path.with_suffix(".feather")
+    try:
+        frame = pd.read_csv(csv_path)
+        with _atomic_target(feather_path, mode_from=csv_path) as tmp:
+            frame.to_feather(tmp)
+    except Exception as e:
+        feather_path.unlink(missing_ok=True)
+        print(f"Warning: Could not write {feather_path}: {e}", file=sys.stderr)
+
+
+def write_rows_csv(path: Path, rows: list[dict[str, Any]]) -> None:
+    if not rows:
+        return
+    _merge_rows_into_csv(path, rows)
+    _write_feather(path)
+
+
+def write_row_csv(path: Path, row: dict[str, Any]) -> None:
+    write_rows_csv(path, [row])
 
 
 def main() -> int:
@@ -6,12 +6,10 @@ Plot daily mortgage/treasury series from data/mortgage_daily.csv.
 from __future__ import annotations
 
 import argparse
-import csv
 import sys
-from datetime import datetime
 from pathlib import Path
-from typing import Optional
 
+import pandas as pd
 import plotly.graph_objects as go
 
 
@@ -19,24 +17,39 @@ DATA_PATH = Path("data/mortgage_daily.csv")
 PLOT_PATH = Path("data/daily_rates.html")
 
 
-def parse_float(value: str | None) -> Optional[float]:
-    if value is None:
-        return None
-    value = value.strip()
-    if not value:
-        return None
-    try:
-        return float(value)
-    except ValueError:
-        return None
+# Numeric columns plotted below; anything unparseable becomes NaN (a gap in the line).
+RATE_COLUMNS = [
+    "finfam_30y_min_apr",
+    "zillow_or_30y_rate",
+    "bankrate_or_30y_rate",
+    "fred_DGS10_value",
+    "fred_MORTGAGE30US_value",
+    "yahoo_^TNX_close",
+]
+INSTITUTION_COLUMN = "finfam_30y_min_apr_institution"
 
 
-def load_rows(path: Path) -> list[dict[str, str]]:
+def load_rows(path: Path) -> pd.DataFrame:
     if not path.exists():
         raise FileNotFoundError(f"Missing data file: {path}")
-    with path.open("r", newline="", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        return list(reader)
+    # Prefer the Feather mirror written alongside the CSV, unless the CSV is newer or the mirror is unreadable.
+    df = None
+    feather_path = path.with_suffix(".feather")
+    if feather_path.exists() and feather_path.stat().st_mtime >= path.stat().st_mtime:
+        try:
+            df = pd.read_feather(feather_path)
+        except Exception as exc:
+            print(f"Warning: Could not read {feather_path}, using CSV: {exc}", file=sys.stderr)
+    if df is None:
+        df = pd.read_csv(path)
+    # Rows whose run date doesn't parse are dropped rather than plotted at NaT.
+    df["run_date_utc"] = pd.to_datetime(df["run_date_utc"], format="%Y-%m-%d", cache=True, errors="coerce")
+    df = df.dropna(subset=["run_date_utc"])
+    for col in RATE_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce") if col in df else float("nan")
+    if INSTITUTION_COLUMN not in df:
+        df[INSTITUTION_COLUMN] = None
+    return df
 
 
 def parse_args() -> argparse.Namespace:
@@ -48,46 +61,23 @@ def parse_args() -> argparse.Namespace:
 
 def main() -> int:
     args = parse_args()
-    rows = load_rows(DATA_PATH)
-    if not rows:
-        raise RuntimeError("No rows found in data/mortgage_daily.csv")
-
-    dates: list[datetime] = []
-    finfam_min: list[Optional[float]] = []
-    zillow_rate: list[Optional[float]] = []
-    bankrate_rate: list[Optional[float]] = []
-    fred_dgs10: list[Optional[float]] = []
-    fred_mort30: list[Optional[float]] = []
-    yahoo_tnx: list[Optional[float]] = []
-    finfam_min_inst: list[str | None] = []
-
-    for row in rows:
-        run_date = row.get("run_date_utc", "")
-        try:
-            dates.append(datetime.strptime(run_date, "%Y-%m-%d"))
-        except ValueError:
-            continue
-
-        finfam_min.append(parse_float(row.get("finfam_30y_min_apr")))
-        zillow_rate.append(parse_float(row.get("zillow_or_30y_rate")))
-        bankrate_rate.append(parse_float(row.get("bankrate_or_30y_rate")))
-        fred_dgs10.append(parse_float(row.get("fred_DGS10_value")))
-        fred_mort30.append(parse_float(row.get("fred_MORTGAGE30US_value")))
-        yahoo_tnx.append(parse_float(row.get("yahoo_^TNX_close")))
-        finfam_min_inst.append(row.get("finfam_30y_min_apr_institution") or None)
-
-    if not dates:
-        raise RuntimeError("No valid dates parsed from data")
+    df = load_rows(DATA_PATH)
+    if df.empty:
+        raise RuntimeError("No rows with a valid run_date_utc found in data/mortgage_daily.csv")
 
     if args.days and args.days > 0:
-        dates = dates[-args.days :]
-        finfam_min = finfam_min[-args.days :]
-        zillow_rate = zillow_rate[-args.days :]
-        bankrate_rate = bankrate_rate[-args.days :]
-        fred_dgs10 = fred_dgs10[-args.days :]
-        fred_mort30 = fred_mort30[-args.days :]
-        yahoo_tnx = yahoo_tnx[-args.days :]
-        finfam_min_inst = finfam_min_inst[-args.days :]
+        df = df.tail(args.days)
+
+    dates = df["run_date_utc"]
+    finfam_min = df["finfam_30y_min_apr"]
+    zillow_rate = df["zillow_or_30y_rate"]
+    bankrate_rate = df["bankrate_or_30y_rate"]
+    fred_dgs10 = df["fred_DGS10_value"]
+    fred_mort30 = df["fred_MORTGAGE30US_value"]
+    yahoo_tnx = df["yahoo_^TNX_close"]
+    # Keep missing institutions as None so the hover text is blank rather than "nan".
+    inst = df[INSTITUTION_COLUMN]
+    finfam_min_inst = inst.astype(object).where(inst.notna(), None)
 
     fig = go.Figure()
     fig.add_trace(
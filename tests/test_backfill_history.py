@@ -0,0 +1,16 @@
+from backfill_history import RETRY_MAX_WAIT, retry_delay
+
+
+def test_retry_delay_honors_short_retry_after() -> None:
+    assert retry_delay(0, "3") == 3.0
+
+
+def test_retry_delay_gives_up_on_long_retry_after() -> None:
+    assert retry_delay(0, "86400") is None
+    assert retry_delay(0, "Fri, 31 Dec 9999 23:59:59 GMT") is None
+
+
+def test_retry_delay_backoff_is_capped() -> None:
+    assert retry_delay(0) == 0.5
+    assert retry_delay(20) == RETRY_MAX_WAIT
+    assert retry_delay(1, "not a date") == 1.0
@@ -0,0 +1,106 @@
+from pathlib import Path
+
+import pytest
+
+import finfam
+from finfam import http_get_cached, write_row_csv, write_rows_csv
+
+
+def test_write_row_csv_appends_after_missing_trailing_newline(tmp_path: Path) -> None:
+    path = tmp_path / "rates.csv"
+    path.write_text("run_date_utc,a\n2025-01-01,1", encoding="utf-8")
+
+    write_row_csv(path, {"run_date_utc": "2025-01-02", "a": 2})
+
+    assert path.read_text(encoding="utf-8").splitlines() == [
+        "run_date_utc,a",
+        "2025-01-01,1",
+        "2025-01-02,2",
+    ]
+
+
+def test_write_row_csv_replaces_same_day_row(tmp_path: Path) -> None:
+    path = tmp_path / "rates.csv"
+    write_row_csv(path, {"run_date_utc": "2025-01-01", "a": 1})
+    write_row_csv(path, {"run_date_utc": "2025-01-02", "a": 2})
+    write_row_csv(path, {"run_date_utc": "2025-01-01", "a": 3})
+
+    assert path.read_text(encoding="utf-8").splitlines() == [
+        "run_date_utc,a",
+        "2025-01-01,3",
+        "2025-01-02,2",
+    ]
+
+
+def test_single_and_batch_writes_format_cells_the_same(tmp_path: Path) -> None:
+    rows = [
+        {"run_date_utc": "2025-01-01", "a": float("nan"), "b": None},
+        {"run_date_utc": "2025-01-02", "a": 1, "b": 2.5},
+    ]
+    one_by_one = tmp_path / "single.csv"
+    batched = tmp_path / "batch.csv"
+    for row in rows:
+        write_row_csv(one_by_one, row)
+    write_rows_csv(batched, rows)
+
+    assert batched.read_bytes() == one_by_one.read_bytes()
+    assert batched.read_bytes().splitlines()[1] == b"2025-01-01,nan,"
+
+
+def test_rewrite_rejects_rows_longer_than_header(tmp_path: Path) -> None:
+    path = tmp_path / "rates.csv"
+    original = b"run_date_utc,a\r\n2025-01-01,1,EXTRA\r\n"
+    path.write_bytes(original)
+
+    with pytest.raises(ValueError, match=r"rates\.csv:2:"):
+        write_row_csv(path, {"run_date_utc": "2025-01-02", "a": 2, "b": 3})
+
+    assert path.read_bytes() == original
+    assert [p.name for p in tmp_path.iterdir()] == ["rates.csv"]
+
+
+def test_rewrite_pads_short_rows(tmp_path: Path) -> None:
+    path = tmp_path / "rates.csv"
+    path.write_bytes(b"run_date_utc,a,b\r\n2025-01-01,1\r\n")
+
+    write_row_csv(path, {"run_date_utc": "2025-01-02", "c": 3})
+
+    assert path.read_text(encoding="utf-8").splitlines() == [
+        "run_date_utc,a,b,c",
+        "2025-01-01,1,,",
+        "2025-01-02,,,3",
+    ]
+
+
+class _FakeResponse:
+    def __init__(self, status_code: int, text: str = "", headers: dict[str, str] | None = None) -> None:
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+
+class _FakeSession:
+    def __init__(self, responses: list[_FakeResponse]) -> None:
+        self.responses = responses
+        self.sent: list[dict[str, str]] = []
+
+    def get(self, url: str, headers: dict[str, str], timeout: int) -> _FakeResponse:
+        self.sent.append(headers)
+        return self.responses.pop(0)
+
+
+def test_http_get_cached_revalidates_with_etag_only(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    session = _FakeSession([_FakeResponse(200, "body", {"ETag": '"v1"'}), _FakeResponse(304)])
+    monkeypatch.setattr(finfam, "_SESSION", session)
+    cache_path = tmp_path / "series.csv"
+
+    assert http_get_cached("https://example.test/x", cache_path) == "body"
+    assert http_get_cached("https://example.test/x", cache_path) == "body"
+
+    # No Last-Modified from the server means no If-Modified-Since from us.
+    assert session.sent == [{}, {"If-None-Match": '"v1"'}]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["series.csv", "series.csv.meta.json"]
@@ -0,0 +1,19 @@
+import os
+from pathlib import Path
+
+from plot_rates import load_rows
+
+
+def test_load_rows_falls_back_to_csv_when_feather_is_unreadable(tmp_path: Path) -> None:
+    csv_path = tmp_path / "mortgage_daily.csv"
+    csv_path.write_text("run_date_utc,finfam_30y_min_apr\n2025-01-01,6.1\n", encoding="utf-8")
+    feather_path = csv_path.with_suffix(".feather")
+    feather_path.write_bytes(b"ARROW1 truncated")
+    # Make the broken mirror look fresh so load_rows tries it first.
+    stat = csv_path.stat()
+    os.utime(feather_path, (stat.st_atime, stat.st_mtime + 10))
+
+    df = load_rows(csv_path)
+
+    assert df["finfam_30y_min_apr"].tolist() == [6.1]
+    assert df["run_date_utc"].dt.strftime("%Y-%m-%d").tolist() == ["2025-01-01"]